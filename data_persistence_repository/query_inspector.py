@@ -0,0 +1,187 @@
+from collections import Counter, deque
+from dataclasses import dataclass, field
+from typing import List, Optional, Tuple, Dict
+import json
+
+from sqlalchemy import Column, MetaData, Select, UniqueConstraint
+from sqlalchemy.sql import visitors
+from sqlalchemy.sql.expression import Executable, ClauseElement
+from sqlalchemy.ext.compiler import compiles
+
+import logging
+
+logger = logging.getLogger("sql_repository")
+
+'''
+Opt-in diagnostics for the statements issued by the repository read methods (get, filter, filter_by_list).
+Every inspected statement is run through postgres EXPLAIN (FORMAT JSON) and the resulting plan is checked for
+sequential scans and, when ANALYZE is enabled, for row estimates that are far off the actual row counts.
+The (model, filter columns) combinations are counted over time so that missing indexes can be suggested.
+'''
+
+
+class Explain(Executable, ClauseElement):
+    """EXPLAIN (FORMAT JSON) of a statement, compiled and executed like the statement itself so binds get processed"""
+    inherit_cache = False
+
+    def __init__(self, statement: Select, analyze: bool = False):
+        self.statement = statement
+        self.analyze = analyze
+
+
+@compiles(Explain, 'postgresql')
+def _compile_explain(element: Explain, compiler, **kw):
+    options = "ANALYZE, FORMAT JSON" if element.analyze else "FORMAT JSON"
+    sql = f"EXPLAIN ({options}) {compiler.process(element.statement, **kw)}"
+    # processing the explained statement registers its columns as the result columns, so the plan would be
+    # decoded with the types of the explained columns. there is no public api to drop them, tests cover it
+    compiler._result_columns = []
+    return sql
+
+
+@dataclass
+class QueryPlan:
+    model: str
+    columns: Dict[str, Tuple[str, ...]]
+    statement: str
+    plan: dict
+    seq_scans: List[str] = field(default_factory=list)
+    row_mismatches: List[Tuple[str, int, int]] = field(default_factory=list)
+
+
+@dataclass
+class IndexSuggestion:
+    table: str
+    columns: Tuple[str, ...]
+    calls: int
+    seq_scans: int
+
+    @property
+    def name(self) -> str:
+        return f"ix_{self.table}_{'_'.join(self.columns)}"
+
+    @property
+    def ddl(self) -> str:
+        return f"CREATE INDEX {self.name} ON {self.table} ({', '.join(self.columns)})"
+
+
+class QueryInspector:
+
+    def __init__(self, analyze: bool = False, mismatch_ratio: float = 10.0, history: int = 100):
+        """
+        https://www.postgresql.org/docs/current/using-explain.html
+        :param analyze: use EXPLAIN ANALYZE (the statement gets executed a second time)
+        :param mismatch_ratio: flag plan nodes where estimated and actual rows differ by more than this factor
+        :param history: how many of the latest plans to keep
+        """
+        self.analyze = analyze
+        self.mismatch_ratio = mismatch_ratio
+        self.plans = deque(maxlen=history)
+        # (model, table, columns) -> number of calls
+        self.usage = Counter()
+        # (table, columns) -> number of calls that ended up in a sequential scan of that table
+        self.seq_scan_usage = Counter()
+
+    def explain(self, statement: Select, dialect) -> Optional[Explain]:
+        """the EXPLAIN statement to execute for the given statement"""
+        if dialect.name != 'postgresql':
+            logger.debug(f"Query inspection is not supported for dialect {dialect.name}")
+            return None
+        return Explain(statement, analyze=self.analyze)
+
+    def record(self, model, statement: Select, explain_result) -> QueryPlan:
+        """parse the EXPLAIN output and aggregate the usage of the filtered columns"""
+        if isinstance(explain_result, str):
+            # asyncpg does not decode json columns
+            explain_result = json.loads(explain_result)
+        plan = explain_result[0]["Plan"]
+        columns = self._filter_columns(statement)
+        query_plan = QueryPlan(
+            model=model.__name__,
+            columns=columns,
+            statement=str(statement),
+            plan=plan,
+        )
+        self._walk(plan, query_plan)
+
+        for table, table_columns in columns.items():
+            self.usage[(query_plan.model, table, table_columns)] += 1
+            if table in query_plan.seq_scans:
+                self.seq_scan_usage[(table, table_columns)] += 1
+        for table in query_plan.seq_scans:
+            logger.warning(f"Sequential scan on {table} for {query_plan.model} filtered by {columns.get(table, ())}")
+        for node, estimated, actual in query_plan.row_mismatches:
+            logger.warning(f"Row estimate mismatch on {node} for {query_plan.model}: {estimated} estimated, {actual} actual")
+
+        self.plans.append(query_plan)
+        return query_plan
+
+    def most_used(self, limit: Optional[int] = None) -> List[Tuple[Tuple[str, str, Tuple[str, ...]], int]]:
+        """most used (model, table, filter columns) combinations"""
+        return self.usage.most_common(limit)
+
+    def suggest_indexes(self, metadata: MetaData, min_calls: int = 1) -> List[IndexSuggestion]:
+        """suggest indexes for the used filter columns that are not covered by any index declared in metadata"""
+        calls = Counter()
+        for (_, table, columns), count in self.usage.items():
+            calls[(table, columns)] += count
+
+        suggestions = []
+        for (table, columns), count in calls.items():
+            if count < min_calls or table not in metadata.tables:
+                continue
+            if self._is_indexed(metadata.tables[table], columns):
+                continue
+            suggestions.append(IndexSuggestion(
+                table=table,
+                columns=columns,
+                calls=count,
+                seq_scans=self.seq_scan_usage[(table, columns)],
+            ))
+        return sorted(suggestions, key=lambda s: (s.seq_scans, s.calls), reverse=True)
+
+    def reset(self):
+        self.plans.clear()
+        self.usage.clear()
+        self.seq_scan_usage.clear()
+
+    def _walk(self, node: dict, query_plan: QueryPlan):
+        if node.get("Node Type") == "Seq Scan" and node.get("Relation Name") not in query_plan.seq_scans:
+            query_plan.seq_scans.append(node["Relation Name"])
+        # nodes that never ran (inner side of joins, under a LIMIT) have no meaningful actual rows
+        if "Actual Rows" in node and node.get("Actual Loops") != 0:
+            estimated, actual = node["Plan Rows"], node["Actual Rows"]
+            if max(estimated, actual, 1) / max(min(estimated, actual), 1) > self.mismatch_ratio:
+                query_plan.row_mismatches.append((node["Node Type"], estimated, actual))
+        for child in node.get("Plans", []):
+            self._walk(child, query_plan)
+
+    @staticmethod
+    def _filter_columns(statement: Select) -> Dict[str, Tuple[str, ...]]:
+        """table name -> sorted names of the columns used in the where clause"""
+        columns = {}
+        if statement.whereclause is None:
+            return columns
+        for element in visitors.iterate(statement.whereclause):
+            if isinstance(element, Column) and element.table is not None:
+                columns.setdefault(element.table.name, set()).add(element.name)
+        return {table: tuple(sorted(names)) for table, names in columns.items()}
+
+    @staticmethod
+    def _is_indexed(table, columns: Tuple[str, ...]) -> bool:
+        """
+        columns are covered when they include all the columns of the primary key or of a unique constraint / index
+        (at most one row matches) or when they are the leading columns of an index
+        """
+        unique = [table.primary_key] + [
+            c for c in table.constraints if isinstance(c, UniqueConstraint)
+        ] + [i for i in table.indexes if i.unique]
+        for candidate in unique:
+            names = {c.name for c in candidate.columns}
+            if names and names <= set(columns):
+                return True
+        for candidate in unique + list(table.indexes):
+            names = [c.name for c in candidate.columns]
+            if names and set(names[:len(columns)]) == set(columns):
+                return True
+        return False
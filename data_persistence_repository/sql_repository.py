@@ -1,10 +1,12 @@
-from typing import List, Iterable, Optional
+from typing import List, Iterable, Iterator, Optional, Tuple
 import contextlib
 
-from sqlalchemy import create_engine, orm, MetaData, Engine
+from sqlalchemy import create_engine, orm, MetaData, Engine, insert, delete
 from sqlalchemy.exc import NoResultFound
 
 from data_persistence_repository.repository_interface import Repository
+from data_persistence_repository.query_inspector import QueryInspector
+from data_persistence_repository import watermark
 
 '''
 Read about how to map dataclasses to sqlalchemy tables here:
@@ -23,16 +25,19 @@ class SqlRepository(Repository):
     def __init__(
             self,
             url: Optional[str] = None,
-            engine: Optional[Engine] = None
+            engine: Optional[Engine] = None,
+            inspector: Optional[QueryInspector] = None
     ):
         """
         https://docs.sqlalchemy.org/en/14/core/pooling.html#pool-disconnects
         :param url: sql url
         :param engine: sql engine
+        :param inspector: opt-in query plan inspector for the read methods
         """
         # Pessimistic testing of connections that recycles connections to avoid stale
         self._engine = engine if engine else create_engine(url, pool_pre_ping=True, pool_recycle=3600)
         self.session = None
+        self.inspector = inspector
 
     @contextlib.contextmanager
     def start_session(self, rollback=True):
@@ -61,6 +66,30 @@ class SqlRepository(Repository):
         # create tables, run migrations, etc
         self.metadata_obj.create_all(self._engine)
 
+    def sync_watermark_schema(self):
+        # create the repository_watermark table used by read_changes
+        watermark.watermark_metadata.create_all(self._engine)
+
+    def inspect_query(self, session: orm.Session, model, query: orm.Query):
+        """
+        run EXPLAIN for the query statement if an inspector is set
+        it runs in a savepoint and errors are only logged, so inspection never breaks the inspected read
+        """
+        if self.inspector is None:
+            return None
+        explain = self.inspector.explain(query.statement, session.get_bind().dialect)
+        if explain is None:
+            return None
+        # flush errors belong to the caller, the savepoint would otherwise swallow them
+        session.flush()
+        try:
+            with session.begin_nested():
+                result = session.execute(explain).scalar()
+            return self.inspector.record(model, query.statement, result)
+        except Exception as ex:
+            logger.error(f"Query inspection error: {str(ex)}")
+            return None
+
     def add(self, session: orm.Session, instance: object):
         """save object"""
         return session.add(instance)
@@ -71,8 +100,10 @@ class SqlRepository(Repository):
 
     def get(self, session: orm.Session, model, **kwargs):
         """get object"""
+        query = session.query(model).filter_by(**kwargs)
+        self.inspect_query(session, model, query)
         try:
-            return session.query(model).filter_by(**kwargs).one()
+            return query.one()
         except NoResultFound:
             return None
 
@@ -89,15 +120,64 @@ class SqlRepository(Repository):
         if args and kwargs:
             raise ValueError('Cannot use filter method with both args and kwargs')
         if args:
-            res = session.query(model).filter(*args).all()
+            query = session.query(model).filter(*args)
         elif kwargs:
-            res = session.query(model).filter_by(**kwargs).all()
-        return res
+            query = session.query(model).filter_by(**kwargs)
+        self.inspect_query(session, model, query)
+        return query.all()
 
     def filter_by_list(self, session: orm.Session, model, field: str, items_list: List) -> Iterable:
         query_field = getattr(model, field)
-        return session.query(model).filter(query_field.in_(items_list)).all()
+        query = session.query(model).filter(query_field.in_(items_list))
+        self.inspect_query(session, model, query)
+        return query.all()
 
     def patch(self, session: orm.Session, model, update_data: dict, **kwargs):
         """Update specific fields of an object"""
         session.query(model).filter_by(**kwargs).update(update_data, synchronize_session='fetch')
+
+    def get_watermark(self, session: orm.Session, model, name: str) -> Optional[Tuple]:
+        """get the persisted checkpoint (watermark, primary key) of the named change reader of the model"""
+        raw = session.execute(watermark.checkpoint_statement(model, name)).scalar_one_or_none()
+        return watermark.load_checkpoint(watermark.watermark_columns(model), raw)
+
+    def save_watermark(self, session: orm.Session, model, name: str, checkpoint: Tuple):
+        """
+        persist the checkpoint of the named change reader of the model
+        on dialects without INSERT ... ON CONFLICT a reader name must only be used by one writer at a time
+        """
+        upsert = watermark.upsert_statement(session.get_bind().dialect, model, name, checkpoint)
+        if upsert is not None:
+            session.execute(upsert)
+            return
+        result = session.execute(watermark.update_statement(model, name, checkpoint))
+        if result.rowcount == 0:
+            session.execute(insert(watermark.watermark_table).values(
+                table_name=watermark.table_name(model),
+                name=name,
+                checkpoint=watermark.dump_checkpoint(checkpoint)
+            ))
+
+    def reset_watermark(self, session: orm.Session, model, name: str):
+        """forget the checkpoint so the next read starts from the beginning of the table"""
+        table = watermark.watermark_table
+        session.execute(delete(table).where(table.c.table_name == watermark.table_name(model), table.c.name == name))
+
+    def read_changes(self, session: orm.Session, model, name: str, batch_size: int = 1000) -> Iterator[List]:
+        """
+        stream the objects changed since the persisted watermark in batches ordered by the model __watermark__
+        the checkpoint is saved in the session after each batch is consumed, so it is committed together with
+        whatever the caller did with the batch
+        """
+        columns = watermark.watermark_columns(model)
+        checkpoint = self.get_watermark(session, model, name)
+        while True:
+            statement = watermark.changes_statement(model, columns, checkpoint, batch_size)
+            rows = session.execute(statement).unique().all()
+            if not rows:
+                return
+            yield [row[0] for row in rows]
+            checkpoint = tuple(rows[-1][1:])
+            self.save_watermark(session, model, name, checkpoint)
+            if len(rows) < batch_size:
+                return
@@ -1,4 +1,4 @@
-from typing import List, Iterable, Optional
+from typing import List, Iterable, AsyncIterator, Optional, Tuple
 import contextlib
 import asyncio
 
@@ -8,11 +8,13 @@ from sqlalchemy.ext.asyncio import (
     AsyncEngine,
     async_sessionmaker,
 )
-from sqlalchemy import MetaData, select, delete, update
+from sqlalchemy import MetaData, Select, select, insert, delete, update
 from sqlalchemy.orm import registry
 from sqlalchemy.exc import NoResultFound
 
 from .repository_interface import Repository
+from .query_inspector import QueryInspector
+from . import watermark
 
 import logging
 
@@ -23,17 +25,24 @@ class AsyncSqlRepository(Repository):
     metadata_obj = MetaData()
     registry = registry()
 
-    def __init__(self, url: Optional[str] = None, engine: Optional[AsyncEngine] = None):
+    def __init__(
+            self,
+            url: Optional[str] = None,
+            engine: Optional[AsyncEngine] = None,
+            inspector: Optional[QueryInspector] = None
+    ):
         """
         Asynchronous SQL repository.
         :param url: SQL URL for the database connection.
         :param engine: Async engine, if already created.
+        :param inspector: Opt-in query plan inspector for the read methods.
         """
         if engine is None and url is None:
             raise ValueError("Either url or engine must be provided")
 
         self._engine = engine if engine else create_async_engine(url, echo=True, pool_recycle=3600, pool_pre_ping=True)
         self._session_factory = async_sessionmaker(self._engine, expire_on_commit=False, class_=AsyncSession)
+        self.inspector = inspector
 
     async def get_session(self):
         return self._session_factory()
@@ -59,6 +68,32 @@ class AsyncSqlRepository(Repository):
         async with self._engine.begin() as conn:
             await conn.run_sync(self.metadata_obj.create_all)
 
+    async def sync_watermark_schema(self):
+        """Asynchronously create the repository_watermark table used by read_changes."""
+        async with self._engine.begin() as conn:
+            await conn.run_sync(watermark.watermark_metadata.create_all)
+
+    async def inspect_query(self, session: AsyncSession, model, statement: Select):
+        """
+        Asynchronously run EXPLAIN for the statement if an inspector is set.
+        It runs in a savepoint and errors are only logged, so inspection never breaks the inspected read.
+        """
+        if self.inspector is None:
+            return None
+        explain = self.inspector.explain(statement, session.get_bind().dialect)
+        if explain is None:
+            return None
+        # flush errors belong to the caller, the savepoint would otherwise swallow them
+        await session.flush()
+        try:
+            async with session.begin_nested():
+                result = await session.execute(explain)
+                plan = result.scalar()
+            return self.inspector.record(model, statement, plan)
+        except Exception as ex:
+            logger.error(f"Query inspection error: {str(ex)}")
+            return None
+
     async def add(self, session: AsyncSession, instance: object):
         """Asynchronously save an object."""
         session.add(instance)
@@ -69,15 +104,19 @@ class AsyncSqlRepository(Repository):
 
     async def get(self, session: AsyncSession, model, **kwargs):
         """Asynchronously get an object."""
+        statement = select(model).filter_by(**kwargs)
+        await self.inspect_query(session, model, statement)
         try:
-            result = await session.execute(select(model).filter_by(**kwargs))
+            result = await session.execute(statement)
             return result.scalar_one()
         except NoResultFound:
             return None
 
     async def exists(self, session: AsyncSession, model, **kwargs) -> bool:
         """Asynchronously check if an object exists."""
-        result = await session.execute(select(model).filter_by(**kwargs))
+        statement = select(model).filter_by(**kwargs)
+        await self.inspect_query(session, model, statement)
+        result = await session.execute(statement)
         return result.scalar_one_or_none() is not None
 
     async def delete(self, session: AsyncSession, model, **kwargs):
@@ -90,11 +129,13 @@ class AsyncSqlRepository(Repository):
             raise ValueError('Cannot use filter method with both args and kwargs')
 
         if args:
-            result = await session.execute(select(model).filter(*args))
+            statement = select(model).filter(*args)
         elif kwargs:
-            result = await session.execute(select(model).filter_by(**kwargs))
+            statement = select(model).filter_by(**kwargs)
         else:
-            result = await session.execute(select(model))
+            statement = select(model)
+        await self.inspect_query(session, model, statement)
+        result = await session.execute(statement)
 
         # because we're usually using lazy="joined"
         return result.unique().scalars().all()
@@ -102,9 +143,61 @@ class AsyncSqlRepository(Repository):
     async def filter_by_list(self, session: AsyncSession, model, field: str, items_list: List) -> Iterable:
         """Asynchronously filter objects by a list of values in a field."""
         query_field = getattr(model, field)
-        result = await session.execute(select(model).filter(query_field.in_(items_list)))
+        statement = select(model).filter(query_field.in_(items_list))
+        await self.inspect_query(session, model, statement)
+        result = await session.execute(statement)
         return result.scalars().all()
 
     async def patch(self, session: AsyncSession, model, update_data: dict, **kwargs):
         """Asynchronously update specific fields of an object."""
         await session.execute(update(model).filter_by(**kwargs).values(update_data))
+
+    async def get_watermark(self, session: AsyncSession, model, name: str) -> Optional[Tuple]:
+        """Asynchronously get the persisted checkpoint (watermark, primary key) of the named change reader."""
+        result = await session.execute(watermark.checkpoint_statement(model, name))
+        return watermark.load_checkpoint(watermark.watermark_columns(model), result.scalar_one_or_none())
+
+    async def save_watermark(self, session: AsyncSession, model, name: str, checkpoint: Tuple):
+        """
+        Asynchronously persist the checkpoint of the named change reader.
+        On dialects without INSERT ... ON CONFLICT a reader name must only be used by one writer at a time.
+        """
+        upsert = watermark.upsert_statement(session.get_bind().dialect, model, name, checkpoint)
+        if upsert is not None:
+            await session.execute(upsert)
+            return
+        result = await session.execute(watermark.update_statement(model, name, checkpoint))
+        if result.rowcount == 0:
+            await session.execute(insert(watermark.watermark_table).values(
+                table_name=watermark.table_name(model),
+                name=name,
+                checkpoint=watermark.dump_checkpoint(checkpoint)
+            ))
+
+    async def reset_watermark(self, session: AsyncSession, model, name: str):
+        """Asynchronously forget the checkpoint so the next read starts from the beginning of the table."""
+        table = watermark.watermark_table
+        await session.execute(
+            delete(table).where(table.c.table_name == watermark.table_name(model), table.c.name == name)
+        )
+
+    async def read_changes(
+            self, session: AsyncSession, model, name: str, batch_size: int = 1000
+    ) -> AsyncIterator[List]:
+        """
+        Asynchronously stream the objects changed since the persisted watermark in batches.
+        The checkpoint is saved in the session after each batch is consumed.
+        """
+        columns = watermark.watermark_columns(model)
+        checkpoint = await self.get_watermark(session, model, name)
+        while True:
+            statement = watermark.changes_statement(model, columns, checkpoint, batch_size)
+            result = await session.execute(statement)
+            rows = result.unique().all()
+            if not rows:
+                return
+            yield [row[0] for row in rows]
+            checkpoint = tuple(rows[-1][1:])
+            await self.save_watermark(session, model, name, checkpoint)
+            if len(rows) < batch_size:
+                return
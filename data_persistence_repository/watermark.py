@@ -0,0 +1,153 @@
+from typing import List, Optional, Tuple
+from decimal import Decimal
+import datetime
+import json
+import uuid
+
+from sqlalchemy import MetaData, Table, Column, String, Text, Select, UniqueConstraint, select, tuple_, inspect, update
+from sqlalchemy.dialects import postgresql, sqlite
+
+import logging
+
+logger = logging.getLogger("sql_repository")
+
+'''
+Incremental reads of the rows changed since a persisted watermark.
+A model declares its watermark column by name, eg:
+
+class Item:
+    __watermark__ = 'updated_at'
+
+The column has to be non nullable and either an updated-at timestamp or a monotonically increasing version.
+Rows are read ordered by (watermark, primary key) so rows sharing the same watermark value are never skipped
+or read twice between batches. The checkpoint is the (watermark, primary key) of the last row read and it is
+stored per (table, reader name) in the repository_watermark table.
+Each batch only costs the size of the delta with a btree index on exactly (watermark, primary key), eg:
+
+Index('ix_item_updated_at_id', item_table.c.updated_at, item_table.c.id)
+
+without it every batch is a full scan plus a sort. A warning is logged when the index is not declared.
+Only int, float, Decimal, str, uuid, date, time and datetime watermark and primary key columns are supported.
+The table lives in its own watermark_metadata: create it with sync_watermark_schema() or add watermark_metadata
+to the target metadata of your migrations.
+Keep in mind that rows committed later with a lower watermark than the checkpoint (long running transactions
+setting updated_at at their start) will not be picked up.
+'''
+
+watermark_metadata = MetaData()
+
+watermark_table = Table(
+    'repository_watermark',
+    watermark_metadata,
+    Column('table_name', String(255), primary_key=True),
+    Column('name', String(255), primary_key=True),
+    Column('checkpoint', Text, nullable=False)
+)
+
+# types a checkpoint value can be stored as json and read back as
+supported_types = (int, float, Decimal, str, uuid.UUID, datetime.date, datetime.time)
+
+# tables already warned about the missing watermark index
+_unindexed_tables = set()
+
+# dialects supporting INSERT ... ON CONFLICT DO UPDATE
+upsert_inserts = {
+    'postgresql': postgresql.insert,
+    'sqlite': sqlite.insert,
+}
+
+
+def watermark_columns(model) -> List[Column]:
+    """the watermark column followed by the primary key columns used to break ties"""
+    name = getattr(model, '__watermark__', None)
+    if name is None:
+        raise ValueError(f'{model.__name__} does not declare a __watermark__ column')
+    mapper = inspect(model)
+    watermark = mapper.columns[name]
+    columns = [watermark] + [c for c in mapper.primary_key if c is not watermark]
+    for column in columns:
+        try:
+            python_type = column.type.python_type
+        except NotImplementedError:
+            python_type = None
+        # datetime is a subclass of date
+        if python_type is None or not issubclass(python_type, supported_types):
+            raise ValueError(f'{model.__name__}.{column.name} of type {column.type} cannot be used as a watermark checkpoint')
+    if not has_index(watermark.table, columns) and watermark.table.name not in _unindexed_tables:
+        _unindexed_tables.add(watermark.table.name)
+        logger.warning(
+            f"{watermark.table.name} has no index on ({', '.join(c.name for c in columns)}), "
+            f"every read_changes batch will scan the whole table"
+        )
+    return columns
+
+
+def has_index(table: Table, columns: List[Column]) -> bool:
+    """an index, primary key or unique constraint starting with the columns in this order"""
+    names = [c.name for c in columns]
+    candidates = [table.primary_key] + list(table.indexes) + [
+        c for c in table.constraints if isinstance(c, UniqueConstraint)
+    ]
+    return any([c.name for c in candidate.columns][:len(names)] == names for candidate in candidates)
+
+
+def table_name(model) -> str:
+    return watermark_columns(model)[0].table.name
+
+
+def changes_statement(model, columns: List[Column], checkpoint: Optional[Tuple], batch_size: int) -> Select:
+    """
+    select the objects together with their watermark columns, the checkpoint is taken from the row values
+    populate_existing refreshes objects already loaded in the session so the caller never gets stale objects
+    """
+    statement = (
+        select(model, *columns)
+        .order_by(*columns)
+        .limit(batch_size)
+        .execution_options(populate_existing=True)
+    )
+    if checkpoint is not None:
+        statement = statement.where(tuple_(*columns) > tuple_(*checkpoint))
+    return statement
+
+
+def checkpoint_statement(model, name: str) -> Select:
+    table = watermark_table
+    return select(table.c.checkpoint).where(table.c.table_name == table_name(model), table.c.name == name)
+
+
+def upsert_statement(dialect, model, name: str, checkpoint: Tuple):
+    """INSERT ... ON CONFLICT DO UPDATE of the checkpoint, None if the dialect does not support it"""
+    insert = upsert_inserts.get(dialect.name)
+    if insert is None:
+        return None
+    raw = dump_checkpoint(checkpoint)
+    return insert(watermark_table).values(table_name=table_name(model), name=name, checkpoint=raw).on_conflict_do_update(
+        index_elements=[watermark_table.c.table_name, watermark_table.c.name],
+        set_={'checkpoint': raw},
+    )
+
+
+def update_statement(model, name: str, checkpoint: Tuple):
+    table = watermark_table
+    return update(table).where(
+        table.c.table_name == table_name(model), table.c.name == name
+    ).values(checkpoint=dump_checkpoint(checkpoint))
+
+
+def dump_checkpoint(checkpoint: Tuple) -> str:
+    return json.dumps([v.isoformat() if hasattr(v, 'isoformat') else v for v in checkpoint], default=str)
+
+
+def load_checkpoint(columns: List[Column], raw: Optional[str]) -> Optional[Tuple]:
+    if raw is None:
+        return None
+    values = []
+    for column, value in zip(columns, json.loads(raw)):
+        python_type = column.type.python_type
+        if hasattr(python_type, 'fromisoformat'):
+            value = python_type.fromisoformat(value)
+        elif not isinstance(value, python_type):
+            value = python_type(value)
+        values.append(value)
+    return tuple(values)
@@ -1,6 +1,7 @@
 from __future__ import annotations
 from dataclasses import dataclass, field
-from sqlalchemy import Table, Column, Integer, String, ForeignKey, orm
+import enum
+from sqlalchemy import Table, Column, Integer, String, ForeignKey, Enum, Index, orm
 from data_persistence_repository.sql_repository import SqlRepository
 from typing import List, Optional
 
@@ -8,11 +9,18 @@ from typing import List, Optional
 # Imperative style
 metadata = SqlRepository.metadata_obj
 
+
+class TestStatus(enum.Enum):
+    active = 1
+    archived = 2
+
+
 test_table = Table(
     'test_table',
     metadata,
     Column('id', Integer, primary_key=True),
-    Column('name', String(50))
+    Column('name', String(50)),
+    Column('status', Enum(TestStatus), nullable=True)
 )
 
 test_joined_table = Table(
@@ -22,11 +30,21 @@ test_joined_table = Table(
     Column('parent_id', Integer, ForeignKey('test_table.id'))
 )
 
+test_versioned_table = Table(
+    'test_versioned_table',
+    metadata,
+    Column('id', Integer, primary_key=True),
+    Column('name', String(50)),
+    Column('version', Integer, nullable=False),
+    Index('ix_test_versioned_table_version_id', 'version', 'id')
+)
+
 
 @dataclass
 class TestModel:
     id: int = field(init=False)
     name: str = None
+    status: Optional[TestStatus] = None
     joined: Optional[List[TestJoinedModel]] = field(default_factory=list)
 
 
@@ -36,9 +54,18 @@ class TestJoinedModel:
     parent_id: int = field(init=False)
 
 
+@dataclass
+class TestVersionedModel:
+    __watermark__ = 'version'
+    id: int = field(init=False)
+    name: str = None
+    version: int = 0
+
+
 def run_mappers(registry):
     # joined attributes have to be eager loaded in order to avoid async sqlalchemy issues
     registry.map_imperatively(TestModel, test_table, properties={
         "joined": orm.relationship(TestJoinedModel, backref='parent', lazy='selectin')
     })
     registry.map_imperatively(TestJoinedModel, test_joined_table)
+    registry.map_imperatively(TestVersionedModel, test_versioned_table)
@@ -4,6 +4,7 @@ from sqlalchemy import orm, create_engine, exc, text
 from sqlalchemy_utils import create_database, drop_database, database_exists
 
 from data_persistence_repository import SqlRepository
+from data_persistence_repository.query_inspector import QueryInspector
 
 from tests import fake
 
@@ -24,6 +25,7 @@ def test_repo():
     # Create an engine for the in-memory database
     repo = SqlRepository(engine=db_engine)
     repo.sync_schema()
+    repo.sync_watermark_schema()
     fake.run_mappers(repo.registry)
 
     yield repo
@@ -167,3 +169,93 @@ def test_patch(test_repo: SqlRepository):
         result_not = test_repo.get(s, fake.TestModel, id=2)
     assert result.name == 'updated'
     assert result_not.name == 't2'
+
+
+def test_query_inspector(test_repo: SqlRepository):
+    with orm.Session(db_engine) as s:
+        s.execute(text("INSERT INTO test_table(name) VALUES ('t1'), ('t2'), ('t3')"))
+        s.commit()
+    test_repo.inspector = QueryInspector(analyze=True)
+    with test_repo.start_session() as s:
+        assert test_repo.get(s, fake.TestModel, name='t1').name == 't1'
+        assert len(test_repo.filter(s, fake.TestModel, name='t2')) == 1
+        assert len(test_repo.filter_by_list(s, fake.TestModel, 'id', [1, 2])) == 2
+    plan = test_repo.inspector.plans[0]
+    assert plan.model == 'TestModel'
+    assert plan.columns == {'test_table': ('name',)}
+    assert plan.seq_scans == ['test_table']
+    assert test_repo.inspector.most_used(1) == [(('TestModel', 'test_table', ('name',)), 2)]
+    # the primary key already covers the id lookups
+    suggestions = test_repo.inspector.suggest_indexes(fake.metadata)
+    assert [(i.table, i.columns, i.calls) for i in suggestions] == [('test_table', ('name',), 2)]
+    assert suggestions[0].ddl == "CREATE INDEX ix_test_table_name ON test_table (name)"
+
+
+def test_read_changes(test_repo: SqlRepository):
+    with orm.Session(db_engine) as s:
+        s.execute(text(
+            "INSERT INTO test_versioned_table(name, version) VALUES ('t1', 1), ('t2', 2), ('t3', 2), ('t4', 2), ('t5', 3)"
+        ))
+        s.commit()
+    # ties on version 2 are split across batches
+    with test_repo.start_session() as s:
+        batches = list(test_repo.read_changes(s, fake.TestVersionedModel, 'indexer', batch_size=2))
+        assert [[i.name for i in b] for b in batches] == [['t1', 't2'], ['t3', 't4'], ['t5']]
+    with test_repo.start_session() as s:
+        assert test_repo.get_watermark(s, fake.TestVersionedModel, 'indexer') == (3, 5)
+        assert list(test_repo.read_changes(s, fake.TestVersionedModel, 'indexer')) == []
+    with orm.Session(db_engine) as s:
+        s.execute(text("UPDATE test_versioned_table SET version = 4 WHERE name = 't2'"))
+        s.execute(text("INSERT INTO test_versioned_table(name, version) VALUES ('t6', 3)"))
+        s.commit()
+    with test_repo.start_session() as s:
+        batches = list(test_repo.read_changes(s, fake.TestVersionedModel, 'indexer'))
+        assert [[i.name for i in b] for b in batches] == [['t6', 't2']]
+        test_repo.reset_watermark(s, fake.TestVersionedModel, 'indexer')
+    with test_repo.start_session() as s:
+        assert test_repo.get_watermark(s, fake.TestVersionedModel, 'indexer') is None
+
+
+def test_query_inspector_processes_binds(test_repo: SqlRepository):
+    with test_repo.start_session() as s:
+        test_repo.add_bulk(s, [
+            fake.TestModel(name='t1', status=fake.TestStatus.active),
+            fake.TestModel(name='t2', status=fake.TestStatus.archived),
+        ])
+    test_repo.inspector = QueryInspector()
+    with test_repo.start_session() as s:
+        result = test_repo.filter(s, fake.TestModel, status=fake.TestStatus.archived)
+        assert [i.name for i in result] == ['t2']
+    assert len(test_repo.inspector.plans) == 1
+    assert test_repo.inspector.plans[0].columns == {'test_table': ('status',)}
+
+
+def test_read_changes_refreshes_loaded_objects(test_repo: SqlRepository):
+    with orm.Session(db_engine) as s:
+        s.execute(text("INSERT INTO test_versioned_table(name, version) VALUES ('t1', 1), ('t2', 2)"))
+        s.commit()
+    with test_repo.start_session() as s:
+        loaded = test_repo.get(s, fake.TestVersionedModel, name='t1')
+        # changed in the database after being loaded in the session
+        s.execute(text("UPDATE test_versioned_table SET version = 3 WHERE name = 't1'"))
+        batches = list(test_repo.read_changes(s, fake.TestVersionedModel, 'indexer', batch_size=2))
+        assert [[(i.name, i.version) for i in b] for b in batches] == [[('t2', 2), ('t1', 3)]]
+        assert loaded.version == 3
+        assert test_repo.get_watermark(s, fake.TestVersionedModel, 'indexer') == (3, 1)
+    with orm.Session(db_engine) as s:
+        # the same reader name used for another table keeps its own checkpoint
+        s.execute(
+            text("INSERT INTO repository_watermark VALUES ('test_table', 'indexer', :checkpoint)"),
+            {'checkpoint': '["2026-01-01", 1]'}
+        )
+        s.commit()
+    with test_repo.start_session() as s:
+        assert test_repo.get_watermark(s, fake.TestVersionedModel, 'indexer') == (3, 1)
+
+
+def test_query_inspector_keeps_flush_errors(test_repo: SqlRepository):
+    test_repo.inspector = QueryInspector()
+    with pytest.raises(exc.IntegrityError):
+        with test_repo.start_session() as s:
+            test_repo.add(s, fake.TestVersionedModel(name='t1', version=None))
+            test_repo.filter(s, fake.TestVersionedModel, name='t1')
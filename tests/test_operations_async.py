@@ -10,6 +10,7 @@ from sqlalchemy.ext.asyncio import (
     AsyncSession,
 )
 from data_persistence_repository import SqlRepository, AsyncSqlRepository
+from data_persistence_repository.query_inspector import QueryInspector
 
 from tests import fake
 
@@ -38,6 +39,7 @@ async def test_repo():
 
     sync_repo = SqlRepository(url=sync_test_db_url)
     sync_repo.sync_schema()
+    sync_repo.sync_watermark_schema()
     fake.run_mappers(sync_repo.registry)
 
     # Create an engine for the in-memory database
@@ -203,3 +205,85 @@ async def test_patch(test_repo):
         result_not = await test_repo.get(s, fake.TestModel, id=2)
     assert result.name == 'updated'
     assert result_not.name == 't2'
+
+
+@pytest.mark.asyncio
+async def test_query_inspector(test_repo):
+    async with async_sess_factory() as s:
+        await s.execute(text("INSERT INTO test_table(name) VALUES ('t1'), ('t2'), ('t3')"))
+        await s.commit()
+    test_repo.inspector = QueryInspector(analyze=True)
+    async with test_repo.start_session() as s:
+        assert (await test_repo.get(s, fake.TestModel, name='t1')).name == 't1'
+        assert len(await test_repo.filter(s, fake.TestModel, name='t2')) == 1
+        assert len(await test_repo.filter_by_list(s, fake.TestModel, 'id', [1, 2])) == 2
+    plan = test_repo.inspector.plans[0]
+    assert plan.model == 'TestModel'
+    assert plan.columns == {'test_table': ('name',)}
+    assert plan.seq_scans == ['test_table']
+    assert test_repo.inspector.most_used(1) == [(('TestModel', 'test_table', ('name',)), 2)]
+    # the primary key already covers the id lookups
+    suggestions = test_repo.inspector.suggest_indexes(fake.metadata)
+    assert [(i.table, i.columns, i.calls) for i in suggestions] == [('test_table', ('name',), 2)]
+
+
+@pytest.mark.asyncio
+async def test_read_changes(test_repo):
+    async with async_sess_factory() as s:
+        await s.execute(text(
+            "INSERT INTO test_versioned_table(name, version) VALUES ('t1', 1), ('t2', 2), ('t3', 2), ('t4', 2), ('t5', 3)"
+        ))
+        await s.commit()
+    # ties on version 2 are split across batches
+    async with test_repo.start_session() as s:
+        batches = [b async for b in test_repo.read_changes(s, fake.TestVersionedModel, 'indexer', batch_size=2)]
+        assert [[i.name for i in b] for b in batches] == [['t1', 't2'], ['t3', 't4'], ['t5']]
+    async with test_repo.start_session() as s:
+        assert await test_repo.get_watermark(s, fake.TestVersionedModel, 'indexer') == (3, 5)
+        assert [b async for b in test_repo.read_changes(s, fake.TestVersionedModel, 'indexer')] == []
+    async with async_sess_factory() as s:
+        await s.execute(text("INSERT INTO test_versioned_table(name, version) VALUES ('t6', 3)"))
+        await s.commit()
+    async with test_repo.start_session() as s:
+        batches = [b async for b in test_repo.read_changes(s, fake.TestVersionedModel, 'indexer')]
+        assert [[i.name for i in b] for b in batches] == [['t6']]
+
+
+@pytest.mark.asyncio
+async def test_query_inspector_processes_binds(test_repo):
+    async with test_repo.start_session() as s:
+        await test_repo.add_bulk(s, [
+            fake.TestModel(name='t1', status=fake.TestStatus.active),
+            fake.TestModel(name='t2', status=fake.TestStatus.archived),
+        ])
+    test_repo.inspector = QueryInspector()
+    async with test_repo.start_session() as s:
+        result = await test_repo.filter(s, fake.TestModel, status=fake.TestStatus.archived)
+        assert [i.name for i in result] == ['t2']
+        assert await test_repo.exists(s, fake.TestModel, status=fake.TestStatus.active)
+    assert len(test_repo.inspector.plans) == 2
+    assert test_repo.inspector.most_used() == [(('TestModel', 'test_table', ('status',)), 2)]
+
+
+@pytest.mark.asyncio
+async def test_read_changes_refreshes_loaded_objects(test_repo):
+    async with async_sess_factory() as s:
+        await s.execute(text("INSERT INTO test_versioned_table(name, version) VALUES ('t1', 1), ('t2', 2)"))
+        await s.commit()
+    async with test_repo.start_session() as s:
+        loaded = await test_repo.get(s, fake.TestVersionedModel, name='t1')
+        # changed in the database after being loaded in the session
+        await s.execute(text("UPDATE test_versioned_table SET version = 3 WHERE name = 't1'"))
+        batches = [b async for b in test_repo.read_changes(s, fake.TestVersionedModel, 'indexer', batch_size=2)]
+        assert [[(i.name, i.version) for i in b] for b in batches] == [[('t2', 2), ('t1', 3)]]
+        assert loaded.version == 3
+        assert await test_repo.get_watermark(s, fake.TestVersionedModel, 'indexer') == (3, 1)
+
+
+@pytest.mark.asyncio
+async def test_query_inspector_keeps_flush_errors(test_repo):
+    test_repo.inspector = QueryInspector()
+    with pytest.raises(exc.IntegrityError):
+        async with test_repo.start_session() as s:
+            await test_repo.add(s, fake.TestVersionedModel(name='t1', version=None))
+            await test_repo.filter(s, fake.TestVersionedModel, name='t1')
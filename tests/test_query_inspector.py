@@ -0,0 +1,63 @@
+from sqlalchemy import MetaData, Table, Column, Integer, String, Index, UniqueConstraint, select
+from sqlalchemy.dialects import postgresql
+
+from data_persistence_repository.query_inspector import QueryInspector, Explain
+
+"""database free tests of the plan parsing and index suggestions"""
+
+metadata = MetaData()
+
+item_table = Table(
+    'item',
+    metadata,
+    Column('id', Integer, primary_key=True),
+    Column('name', String(50)),
+    Column('code', String(50)),
+    Column('category', Integer),
+    Column('owner', Integer),
+    UniqueConstraint('code'),
+    Index('ix_item_category_owner', 'category', 'owner'),
+)
+
+
+class Item:
+    pass
+
+
+def test_explain_has_no_result_columns():
+    compiled = Explain(select(item_table).where(item_table.c.name == 'x')).compile(dialect=postgresql.dialect())
+    assert str(compiled).startswith('EXPLAIN (FORMAT JSON) SELECT item.id')
+    # the plan must not be decoded with the types of the explained columns
+    assert compiled._result_columns == []
+
+
+def test_row_mismatches():
+    inspector = QueryInspector(analyze=True)
+    plan = inspector.record(Item, select(item_table).where(item_table.c.name == 'x'), [{"Plan": {
+        "Node Type": "Nested Loop", "Plan Rows": 1, "Actual Rows": 100, "Actual Loops": 1,
+        "Plans": [
+            {"Node Type": "Seq Scan", "Relation Name": "item", "Plan Rows": 100, "Actual Rows": 100, "Actual Loops": 1},
+            # never executed
+            {"Node Type": "Index Scan", "Relation Name": "item", "Plan Rows": 50, "Actual Rows": 0, "Actual Loops": 0},
+        ]
+    }}])
+    assert plan.row_mismatches == [('Nested Loop', 1, 100)]
+    assert plan.seq_scans == ['item']
+    assert inspector.most_used() == [(('Item', 'item', ('name',)), 1)]
+
+
+def test_suggest_indexes():
+    inspector = QueryInspector()
+    plan = [{"Plan": {"Node Type": "Seq Scan", "Relation Name": "item", "Plan Rows": 1}}]
+    for where in [
+        (item_table.c.id == 1, item_table.c.name == 'x'),  # primary key
+        (item_table.c.code == 'c', item_table.c.name == 'x'),  # unique constraint
+        (item_table.c.category == 1,),  # leading columns of an index
+        (item_table.c.owner == 1, item_table.c.category == 1),
+        (item_table.c.name == 'x',),
+        (item_table.c.owner == 1,),
+        (item_table.c.owner == 1,),
+    ]:
+        inspector.record(Item, select(item_table).where(*where), plan)
+    suggestions = inspector.suggest_indexes(metadata)
+    assert [(s.columns, s.calls, s.seq_scans) for s in suggestions] == [(('owner',), 2, 2), (('name',), 1, 1)]
@@ -0,0 +1,75 @@
+import datetime
+import logging
+
+import pytest
+from sqlalchemy import MetaData, Table, Column, Integer, DateTime, Interval, Index, orm
+
+from data_persistence_repository import watermark
+
+"""database free tests of the watermark column checks and checkpoint serialization"""
+
+metadata = MetaData()
+
+indexed_table = Table(
+    'indexed_item',
+    metadata,
+    Column('id', Integer, primary_key=True),
+    Column('updated_at', DateTime, nullable=False),
+    Index('ix_indexed_item_updated_at_id', 'updated_at', 'id'),
+)
+
+unindexed_table = Table(
+    'unindexed_item',
+    metadata,
+    Column('id', Integer, primary_key=True),
+    Column('updated_at', DateTime, nullable=False),
+    Column('age', Interval, nullable=False),
+)
+
+
+class IndexedItem:
+    __watermark__ = 'updated_at'
+
+
+class UnindexedItem:
+    __watermark__ = 'updated_at'
+
+
+class IntervalItem:
+    __watermark__ = 'age'
+
+
+@pytest.fixture()
+def mapped():
+    registry = orm.registry()
+    registry.map_imperatively(IndexedItem, indexed_table)
+    registry.map_imperatively(UnindexedItem, unindexed_table)
+    registry.map_imperatively(IntervalItem, unindexed_table)
+    yield
+    registry.dispose()
+
+
+def test_watermark_columns(mapped, caplog):
+    with caplog.at_level(logging.WARNING, logger="sql_repository"):
+        columns = watermark.watermark_columns(IndexedItem)
+    assert [c.name for c in columns] == ['updated_at', 'id']
+    assert not caplog.records
+
+
+def test_missing_index_warning(mapped, caplog):
+    with caplog.at_level(logging.WARNING, logger="sql_repository"):
+        watermark.watermark_columns(UnindexedItem)
+        watermark.watermark_columns(UnindexedItem)
+    assert len(caplog.records) == 1
+    assert 'unindexed_item has no index on (updated_at, id)' in caplog.records[0].getMessage()
+
+
+def test_unsupported_type(mapped):
+    with pytest.raises(ValueError):
+        watermark.watermark_columns(IntervalItem)
+
+
+def test_checkpoint_roundtrip(mapped):
+    columns = watermark.watermark_columns(IndexedItem)
+    checkpoint = (datetime.datetime(2026, 1, 1, 12, 30), 5)
+    assert watermark.load_checkpoint(columns, watermark.dump_checkpoint(checkpoint)) == checkpoint